@@ -24,7 +24,7 @@ def get_delta_unbounded(target_eps=1.0, sigma=2.0, q=0.01, ncomp=1E4, nx=1E6, L=
     tol_newton = 1e-10  # set this to, e.g., 0.01*target_delta
 
     dx = 2.0 * L / nx  # discretisation interval \Delta x
-    x = np.linspace(-L, L - dx, nx, dtype=np.complex128)  # grid for the numerical integration
+    x = np.linspace(-L, L - dx, nx, dtype=np.float64)  # grid for the numerical integration
 
     # first ii for which x(ii)>log(1-q),
     # i.e. start of the integral domain
@@ -38,7 +38,7 @@ def get_delta_unbounded(target_eps=1.0, sigma=2.0, q=0.01, ncomp=1E4, nx=1E6, L=
     dLinvx = (sigma ** 2 * np.exp(x[ii + 1:])) / (np.exp(x[ii + 1:]) - (1 - q));
 
     fx = np.zeros(nx)
-    fx[ii + 1:] = np.real(ALinvx * dLinvx)
+    fx[ii + 1:] = ALinvx * dLinvx
     half = int(nx / 2)
 
     # Flip fx, i.e. fx <- D(fx), the matrix D = [0 I;I 0]
@@ -88,7 +88,7 @@ def get_delta_bounded(target_eps=1.0, sigma=2.0, q=0.01, ncomp=1E4, nx=1E6, L=20
     tol_newton = 1e-10  # set this to, e.g., 0.01*target_delta
 
     dx = 2.0 * L / nx  # discretisation interval \Delta x
-    x = np.linspace(-L, L - dx, nx, dtype=np.complex128)  # grid for the numerical integration
+    x = np.linspace(-L, L - dx, nx, dtype=np.float64)  # grid for the numerical integration
 
     # Evaluate the PLD distribution,
     # This is the case of substitution relation (subsection 5.2)
@@ -108,7 +108,7 @@ def get_delta_bounded(target_eps=1.0, sigma=2.0, q=0.01, ncomp=1E4, nx=1E6, L=20
     ALinvx = (1 / np.sqrt(2 * np.pi * sigma ** 2)) * ((1 - q) * np.exp(-Linvx * Linvx / (2 * sigma ** 2)) +
                                                       q * np.exp(-(Linvx - 1) * (Linvx - 1) / (2 * sigma ** 2)))
 
-    fx = np.real(ALinvx * dLinvx)
+    fx = ALinvx * dLinvx
     half = int(nx / 2)
 
     # Flip fx, i.e. fx <- D(fx), the matrix D = [0 I;I 0]
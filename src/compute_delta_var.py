@@ -23,7 +23,7 @@ def get_delta_unbounded(sigma_t, q_t, target_eps=1.0, nx=1E6, L=20.0):
     tol_newton = 1e-10  # set this to, e.g., 0.01*target_delta
 
     dx = 2.0 * L / nx  # discretisation interval \Delta x
-    x = np.linspace(-L, L - dx, nx, dtype=np.complex128)  # grid for the numerical integration
+    x = np.linspace(-L, L - dx, nx, dtype=np.float64)  # grid for the numerical integration
 
     fx_table = []
     F_prod = np.ones(x.size)
@@ -50,7 +50,7 @@ def get_delta_unbounded(sigma_t, q_t, target_eps=1.0, nx=1E6, L=20.0):
         dLinvx = (sigma ** 2 * np.exp(x[ii + 1:])) / (np.exp(x[ii + 1:]) - (1 - q));
 
         fx = np.zeros(nx)
-        fx[ii + 1:] = np.real(ALinvx * dLinvx)
+        fx[ii + 1:] = ALinvx * dLinvx
         half = int(nx / 2)
 
         # Flip fx, i.e. fx <- D(fx), the matrix D = [0 I;I 0]
@@ -99,7 +99,7 @@ def get_delta_bounded(sigma_t, q_t, target_eps=1.0, nx=1E6, L=20.0):
     tol_newton = 1e-10  # set this to, e.g., 0.01*target_delta
 
     dx = 2.0 * L / nx  # discretisation interval \Delta x
-    x = np.linspace(-L, L - dx, nx, dtype=np.complex128)  # grid for the numerical integration
+    x = np.linspace(-L, L - dx, nx, dtype=np.float64)  # grid for the numerical integration
 
     fx_table = []
     F_prod = np.ones(x.size)
@@ -132,7 +132,7 @@ def get_delta_bounded(sigma_t, q_t, target_eps=1.0, nx=1E6, L=20.0):
         ALinvx = (1 / np.sqrt(2 * np.pi * sigma ** 2)) * ((1 - q) * np.exp(-Linvx * Linvx / (2 * sigma ** 2)) +
                                                           q * np.exp(-(Linvx - 1) * (Linvx - 1) / (2 * sigma ** 2)))
 
-        fx = np.real(ALinvx * dLinvx)
+        fx = ALinvx * dLinvx
         half = int(nx / 2)
 
         # Flip fx, i.e. fx <- D(fx), the matrix D = [0 I;I 0]
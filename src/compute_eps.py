@@ -7,228 +7,565 @@ arXiv preprint arXiv:1906.03049 (2019)
 The code is due to Antti Koskela (@koskeant) and Joonas Jälkö (@jjalko)
 '''
 
-import numpy as np
-
+import functools
 
-# Parameters:
-# target_delta - target delta
-# sigma - noise sigma
-# q - subsampling ratio
-# nx - number of points in the discretisation grid
-# L -  limit for the integral
-# ncomp - compute up to ncomp number of compositions
+import numpy as np
+import scipy.fft
+import scipy.special
 
-def get_epsilon_unbounded(target_delta=1e-6, sigma=2.0, q=0.01, ncomp=1E4, nx=1E6, L=20.0):
-    nx = int(nx)
 
-    tol_newton = 1e-10  # set this to, e.g., 0.01*target_delta
+# Returns the grid x for the numerical integration and exp(-x). exp(-x) factors
+# the integrands of the Newton iteration, exp(eps-x) = exp(eps)*exp(-x). The
+# arrays are cached for repeated calls with the same grid, so they are made
+# read-only.
 
+@functools.lru_cache(maxsize=2)
+def _grid(nx, L):
     dx = 2.0 * L / nx  # discretisation interval \Delta x
-    x = np.linspace(-L, L - dx, nx, dtype=np.complex128)  # grid for the numerical integration
+    x = np.linspace(-L, L - dx, nx, dtype=np.float64)
+    neg_x_exp = np.exp(-x)
+
+    x.flags.writeable = False
+    neg_x_exp.flags.writeable = False
+    return x, neg_x_exp
+
+
+# Checks that the ncomp-fold composition can be aligned with the grid: the offset
+# (ncomp-1)*nx/2 removed in _spectrum_power is a whole number of grid points only
+# for an even nx and an integer ncomp. ncomp can also be an array of values.
+
+def _check_grid(nx, ncomp):
+    if nx % 2 != 0:
+        raise ValueError('nx must be even, got nx=' + str(nx) + '.')
+    ncomp = np.asarray(ncomp)
+    if np.any(ncomp != np.floor(ncomp)):
+        raise ValueError('ncomp must be an integer, got ncomp=' + str(ncomp) + '.')
+
+
+# Returns the precision in which the PLD is evaluated for the requested dtype,
+# which must be np.float64 or np.float32. Single precision may not resolve small
+# values of delta, and exp(x) overflows in it on the grid for
+# L > log(max float32) ~ 88.7, in which case double precision is used instead.
+
+def _pld_dtype(dtype, target_delta, L):
+    dtype = np.dtype(dtype)
+    if dtype != np.float64 and dtype != np.float32:
+        raise ValueError('dtype must be np.float64 or np.float32, got dtype=' + str(dtype) + '.')
+    if dtype == np.float32:
+        if L > np.log(np.finfo(np.float32).max):
+            print('Warning: single precision overflows for L=' + str(L) + ', using double precision.')
+            return np.dtype(np.float64)
+        if target_delta < 1e-7:
+            print('Warning: single precision may not be accurate enough for delta=' + str(target_delta) + '.')
+    return dtype
+
+
+# Multiplies out in place by
+# ALinvx = norm*((1-q)*exp(-Linvx^2/(2 sigma^2)) + q*exp(-(Linvx-1)^2/(2 sigma^2))),
+# the factor shared by the PLDs of both relations. Linvx and work are overwritten.
+
+def _mul_alinvx(Linvx, work, q, inv_2s2, norm, out):
+    np.multiply(Linvx, Linvx, out=work)
+    work *= -inv_2s2
+    np.exp(work, out=work)
+    work *= 1 - q
+
+    Linvx -= 1
+    np.multiply(Linvx, Linvx, out=Linvx)
+    Linvx *= -inv_2s2
+    np.exp(Linvx, out=Linvx)
+    Linvx *= q
+    Linvx += work
+
+    out *= Linvx
+    out *= norm
+
+
+# Evaluates the PLD distribution on the grid x and writes it into out, in the
+# precision of x and out.
+# The case of remove/add relation (Subsection 5.1). The PLD vanishes for
+# x <= log(1-q), so any increasing grid can be given, e.g. a full row of a batch.
+
+def _pld_unbounded(x, sigma, q, out):
+    sigma = float(sigma)
+    q = float(q)
+    sigma2 = sigma ** 2
+    inv_2s2 = 0.5 / sigma2
+    norm = 1 / (np.sqrt(2 * np.pi) * sigma)
+    one_minus_q = 1 - q
+
+    # x <= log(1-q) is a prefix of the grid, the PLD is evaluated on the rest
+    m = np.searchsorted(x, np.log1p(-q), side='right')
+    out[:m] = 0
+    x = x[m:]
+    out = out[m:]
+
+    # The intermediate arrays are computed in place in two work buffers,
+    # dLinvx is written directly into out
+    ey = np.exp(x)
+    Linvx = np.subtract(ey, one_minus_q)  # exp(x)-(1-q)
+    np.divide(ey, Linvx, out=out)
+    out *= sigma2  # dLinvx
+
+    np.log(Linvx, out=Linvx)
+    Linvx *= sigma2
+    Linvx += 0.5 - sigma2 * np.log(q)
+
+    _mul_alinvx(Linvx, ey, q, inv_2s2, norm, out)
+
+
+# Evaluates the PLD distribution on the grid x and writes it into out, in the
+# precision of x and out.
+# This is the case of substitution relation (subsection 5.2)
+
+def _pld_bounded(x, sigma, q, out):
+    sigma = float(sigma)
+    q = float(q)
+    sigma2 = sigma ** 2
+    inv_2s2 = 0.5 / sigma2
+    norm = 1 / (np.sqrt(2 * np.pi) * sigma)
+    one_minus_q = 1 - q
+    c = q * np.exp(-inv_2s2)
+    log_2c = np.log(2 * c)
+    c2_4 = 4 * c ** 2
+
+    # The intermediate arrays are computed in place in four work buffers,
+    # dLinvx is written directly into out
+    ey = np.exp(x)
+    a = np.expm1(x)
+    a *= -one_minus_q  # (1-q)*(1-exp(x))
+
+    # sq = sqrt(a^2 + 4c^2*ey) = hypot(a, 2c*exp(x/2)), which does not form a^2,
+    # as it overflows already for x > log(max)/2 in single precision
+    np.multiply(x, 0.5, out=out)
+    np.exp(out, out=out)
+    out *= 2 * c
+    sq = np.hypot(a, out)
+
+    # Linvx = sigma^2*log(term1) with term1 = (sq - a)/(2c), and dLinvx contains
+    # the factor (sq + a)/(4c^2*ey). As (sq - a)*(sq + a) = 4c^2*ey, the
+    # difference is evaluated as a sum on x <= 0, where a >= 0, and the sum as a
+    # difference on x > 0. This avoids the cancellation in both without clamping
+    # term1.
+    m = np.searchsorted(x, 0, side='right')
+    Linvx = np.empty_like(x)
+    np.add(sq[:m], a[:m], out=Linvx[:m])
+    np.subtract(sq[m:], a[m:], out=Linvx[m:])
+
+    # ey*(sq + a)/(4c^2*ey)
+    np.divide(Linvx[:m], c2_4, out=out[:m])
+    np.divide(ey[m:], Linvx[m:], out=out[m:])
+
+    np.log(Linvx, out=Linvx)
+    Linvx[:m] -= x[:m]
+    Linvx[:m] -= log_2c
+    Linvx[:m] *= -sigma2
+    Linvx[m:] -= log_2c
+    Linvx[m:] *= sigma2
+
+    # nom2 = ((4c^2*ey - 2(1-q)*ey*a)/(2*sq) + (1-q)*ey)/ey
+    nom2 = a
+    nom2 *= -one_minus_q
+    nom2 += 0.5 * c2_4
+    nom2 /= sq
+    nom2 += one_minus_q
+    out *= nom2
+    out *= sigma2  # dLinvx
+
+    _mul_alinvx(Linvx, sq, q, inv_2s2, norm, out)
+
+
+# Returns the mass of the PLD outside the window [-L,L], given the inverse linv
+# of the privacy loss for both ends of the window. The PLD is the distribution of
+# the privacy loss of y ~ (1-q)*N(0,sigma^2) + q*N(1,sigma^2), and the loss is
+# increasing in y, so the mass is given by the CDF of this mixture at linv(-L)
+# and linv(L). linv(-L) is None if the PLD vanishes below -L.
+
+def _mass_outside(y_lo, y_hi, sigma, q):
+    mass = (1 - q) * scipy.special.ndtr(-y_hi / sigma) + q * scipy.special.ndtr((1 - y_hi) / sigma)
+    if y_lo is not None:
+        mass += (1 - q) * scipy.special.ndtr(y_lo / sigma) + q * scipy.special.ndtr((y_lo - 1) / sigma)
+    return mass
+
+
+# The mass of the PLD of the remove/add relation outside [-L,L], with Linvx as
+# in _pld_unbounded.
+
+def _mass_outside_unbounded(sigma, q, L):
+    sigma2 = sigma ** 2
+
+    def linv(x):
+        return sigma2 * (np.log(np.exp(x) - (1 - q)) - np.log(q)) + 0.5
+
+    y_lo = linv(-L) if -L > np.log1p(-q) else None
+    return _mass_outside(y_lo, linv(L), sigma, q)
+
+
+# The mass of the PLD of the substitution relation outside [-L,L], with Linvx as
+# in _pld_bounded.
+
+def _mass_outside_bounded(sigma, q, L):
+    sigma2 = sigma ** 2
+    c = q * np.exp(-0.5 / sigma2)
+
+    def linv(x):
+        a = -(1 - q) * np.expm1(x)
+        sq = np.hypot(a, 2 * c * np.exp(0.5 * x))
+        if x <= 0:
+            return sigma2 * (x + np.log(2 * c) - np.log(sq + a))
+        return sigma2 * (np.log(sq - a) - np.log(2 * c))
+
+    return _mass_outside(linv(-L), linv(L), sigma, q)
+
+
+# Computes the spectrum (FF1*dx)^ncomp/dx = FF1^ncomp*dx^(ncomp-1) of the
+# ncomp-fold composition, given the DFT FF1 of length nfft >= nx (along the last
+# axis) of fx, whose first sample is at the grid point start.
+# It is evaluated in place in FF1 as exp(ncomp*(log(FF1) + log(dx)) - log(dx)),
+# the magnitude is clipped to avoid log(0) for vanishing frequencies.
+# ncomp can also be a column of values, one for each row of FF1.
+
+def _spectrum_power(FF1, ncomp, dx, nx, nfft, start):
+    # fx starts from x = -L + start*dx, so the ncomp-fold composition starts from
+    # x = ncomp*(-L + start*dx), i.e. it is offset by (ncomp-1)*nx/2 - ncomp*start
+    # grid points from the grid of cfx. The offset is removed by a circular shift,
+    # i.e. a linear phase of the DFT. For nfft = nx and start = 0 this is the flip
+    # D = [0 I;I 0] applied to fx and cfx. nx must be even and ncomp an integer,
+    # see _check_grid.
+    ncomp_int = np.asarray(ncomp).astype(np.int64)
+    shift = ((ncomp_int - 1) * (nx // 2) - ncomp_int * start) % nfft
+
+    with np.errstate(divide='ignore'):
+        log_spec = np.log(FF1, out=FF1)
+
+    log_mag = log_spec.real
+    log_mag += np.log(dx)
+    np.maximum(log_mag, np.log(np.finfo(np.float64).tiny), out=log_mag)
+    log_mag *= ncomp
+    log_mag -= np.log(dx)
+
+    # The phase is accumulated in place in units of 2*pi/nfft, where the linear
+    # phase k*shift can be reduced modulo nfft exactly in integers. It is added
+    # one row at a time, so only a single row-sized work buffer is needed.
+    turn = 2 * np.pi / nfft
+    phase = log_spec.imag
+    phase *= np.asarray(ncomp) / turn
+
+    rows = np.atleast_2d(phase)
+    shifts = np.broadcast_to(shift, (rows.shape[0], 1))[:, 0]
+    k = np.arange(FF1.shape[-1], dtype=np.int64)
+    k_shift = np.empty_like(k)
+    for row, s in zip(rows, shifts):
+        np.multiply(k, s, out=k_shift)
+        k_shift %= nfft
+        row += k_shift
+
+    phase *= turn
+
+    return np.exp(log_spec, out=log_spec)
+
+
+# Computes the PLD cfx of the ncomp-fold composition from the PLD fx (along the
+# last axis) using the FFT. The spectrum is the only complex array in the
+# computation, cfx and everything derived from it is real.
+# fx may hold only the samples from the grid point start onwards, the PLD is
+# taken to be zero before it. This way the leading zeros of the remove/add PLD
+# are neither stored nor copied into the FFT input.
 
-    # first ii for which x(ii+1)>log(1-q),
-    # i.e. start of the integral domain
-    ii = int(np.floor(float(nx * (L + np.log(1 - q)) / (2 * L))))
-
-    # Initial value \epsilon_0
-    eps_0 = 0
+def _compose(fx, ncomp, dx, nx, start=0):
+    # The FFTs are zero-padded to a length with small prime factors. The padding
+    # does not change dx or the integration limits, as the added samples are zero.
+    # The length cannot be reduced below nx although fx may be shorter, since cfx
+    # is needed on the whole grid and would otherwise alias.
+    nfft = scipy.fft.next_fast_len(nx, real=True)
+
+    # Compute the DFT, fx is real so only the non-negative frequencies are
+    # needed. The DFT is always computed in double precision, as its errors are
+    # amplified ncomp times.
+    FF1 = scipy.fft.rfft(fx.astype(np.float64, copy=False), n=nfft, axis=-1, workers=-1)
 
-    # Evaluate the PLD distribution,
-    # The case of remove/add relation (Subsection 5.1)
-    ey = np.exp(x[ii + 1:])
-    Linvx = (sigma ** 2) * np.log((np.exp(x[ii + 1:]) - (1 - q)) / q) + 0.5
-
-    ALinvx = (1 / np.sqrt(2 * np.pi * sigma ** 2)) * ((1 - q) * np.exp(-Linvx * Linvx / (2 * sigma ** 2)) +
-                                                      q * np.exp(-(Linvx - 1) * (Linvx - 1) / (2 * sigma ** 2)));
-    dLinvx = (sigma ** 2) * ey / (ey - (1 - q));
-
-    fx = np.zeros(nx)
-    fx[ii + 1:] = np.real(ALinvx * dLinvx)
-    half = int(nx / 2)
+    # Compute the inverse DFT
+    cfx = scipy.fft.irfft(_spectrum_power(FF1, ncomp, dx, nx, nfft, start), n=nfft, axis=-1, workers=-1)
+    return cfx[..., :nx]
 
-    # Flip fx, i.e. fx <- D(fx), the matrix D = [0 I;I 0]
-    temp = np.copy(fx[half:])
-    fx[half:] = np.copy(fx[:half])
-    fx[:half] = temp
 
-    # Compute the DFT
-    FF1 = np.fft.fft(fx * dx)
+# Evaluates \delta(eps) and \delta'(eps) for the composed PLD cfx, given
+# neg_x_exp = exp(-x) on the grid x. Both integrands share the factor
+# exp(eps-x)*cfx, so it is computed only once and only over the integral domain
+# x > eps.
 
-    exp_e = 1 - np.exp(eps_0 - x)
-    # Find first jj for which 1-exp(eps_0-x)>0,
+def _delta_and_derivative(eps, neg_x_exp, cfx, dx, nx, L):
+    # Find first kk for which 1-exp(eps-x)>0,
     # i.e. start of the integral domain
-    jj = int(np.floor(float(nx * (L + eps_0) / (2 * L))))
+    kk = int(np.floor(float(nx * (L + eps) / (2 * L))))
+
+    # The integrand is reduced with a dot product, without forming it as an array
+    cfx_tail = cfx[kk + 1:]
+    sum_int2 = -np.exp(eps) * np.dot(neg_x_exp[kk + 1:], cfx_tail)
+    sum_int = np.sum(cfx_tail) + sum_int2
+    return sum_int * dx, sum_int2 * dx
+
+
+# Estimates \delta(L) = int_L^inf (1-exp(L-x))*f(x) dx of the composed PLD,
+# i.e. the part of the PLD cut off past the window, which the grid does not hold.
+# The tail of cfx is extrapolated past L as f(L)*exp(-(x-L)/lam), with the decay
+# length lam measured over the last 1% of the grid, which gives
+# \delta(L) = f(L)*lam^2/(1+lam). A tail that does not decay gives inf.
+# The circular convolution wraps the mass past L onto the left end of the grid,
+# where the composed PLD is otherwise essentially zero, so the first 1% of the
+# grid holds the noise floor of the FFT, which grows with ncomp, plus the wrapped
+# mass. A tail at or below that level cannot be extrapolated, and \delta(L) is
+# bounded by the mass of the left end instead. This is at the rounding level
+# unless the composition wraps around. If most of the composition has left the
+# window, neither end of cfx shows it, which is checked in _accountant_core.
+
+def _delta_past_window(cfx, dx, nx):
+    k = max(nx // 100, 1)
+    floor = np.max(np.abs(cfx[:k]))
+
+    f_L = cfx[-1]
+    if f_L <= floor:
+        return floor * k * dx
+
+    f_k = cfx[-1 - k]
+    if f_k <= f_L:
+        return float('inf')
 
-    # Compute the inverse DFT
-    cfx = np.fft.ifft((FF1 ** ncomp / dx))
+    lam = k * dx / np.log(f_k / f_L)
+    return f_L * lam ** 2 / (1 + lam)
+
+
+# Finds epsilon for which \delta(epsilon) = target_delta using Newton's
+# iteration, given neg_x_exp = exp(-x) on the grid x, starting from epsilon = 0.
+# As \delta(epsilon) is decreasing, every evaluation narrows a bracket
+# [eps_lo, eps_hi] of the solution, and Newton steps that would leave the
+# bracket are replaced by bisection steps, so the iteration always terminates.
+# Returns inf if there is no solution in the window [-L,L], or if \delta(epsilon)
+# is not finite, e.g. after an overflow in the PLD, as the iteration would
+# otherwise stop at once with a NaN residual.
+# The discretised \delta(epsilon) drops to zero at epsilon = L, as the integral
+# is truncated there, so it also has a spurious solution below L whenever the
+# true one is out of the window. inf is therefore returned without iterating if
+# the estimate _delta_past_window of \delta(L) exceeds target_delta.
+
+def _newton_epsilon(target_delta, neg_x_exp, cfx, dx, nx, L, tol_newton):
+    if _delta_past_window(cfx, dx, nx) > target_delta:
+        return float('inf')
+
+    # Initial value \epsilon_0 and the bracket
+    eps_0 = 0
+    eps_lo = -L
+    eps_hi = L
 
-    # Flip again, i.e. cfx <- D(cfx), D = [0 I;I 0]
-    temp = np.copy(cfx[half:])
-    cfx[half:] = cfx[:half]
-    cfx[:half] = temp
+    # Bisection stops when the bracket is this narrow
+    tol_eps = 1e-12 * L
 
     # Evaluate \delta(eps_0) and \delta'(eps_0)
-    exp_e = 1 - np.exp(eps_0 - x)
-    dexp_e = -np.exp(eps_0 - x)
-    integrand = exp_e * cfx
-    integrand2 = dexp_e * cfx
-    sum_int = np.sum(integrand[jj + 1:])
-    sum_int2 = np.sum(integrand2[jj + 1:])
-    delta_temp = sum_int * dx
-    derivative = sum_int2 * dx
+    delta_temp, derivative = _delta_and_derivative(eps_0, neg_x_exp, cfx, dx, nx, L)
+    if not np.isfinite(delta_temp):
+        return float('inf')
 
     # Here tol is the stopping criterion for Newton's iteration
     # e.g., 0.1*delta value or 0.01*delta value (relative error small enough)
-
     while np.abs(delta_temp - target_delta) > tol_newton:
         # print('Residual of the Newton iteration: ' + str(np.abs(delta_temp - target_delta)))
 
-        # Update epsilon
-        eps_0 = eps_0 - (delta_temp - target_delta) / derivative
+        # Update the bracket
+        if delta_temp > target_delta:
+            eps_lo = eps_0
+        else:
+            eps_hi = eps_0
 
-        if (eps_0 < -L or eps_0 > L):
+        if eps_hi - eps_lo < tol_eps:
+            if eps_lo == -L or eps_hi == L:
+                return float('inf')
             break
 
-        # Integrands and integral domain
-        exp_e = 1 - np.exp(eps_0 - x)
-        dexp_e = -np.exp(eps_0 - x)
-        # Find first kk for which 1-exp(eps_0-x)>0,
-        # i.e. start of the integral domain
-        kk = int(np.floor(float(nx * (L + np.real(eps_0)) / (2 * L))))
-
-        integrand = exp_e * cfx
-        sum_int = np.sum(integrand[kk + 1:])
-        delta_temp = sum_int * dx
+        # Update epsilon, bisect if the Newton step leaves the bracket
+        if derivative < 0:
+            eps_0 = eps_0 - (delta_temp - target_delta) / derivative
+        if not (eps_lo < eps_0 < eps_hi):
+            eps_0 = 0.5 * (eps_lo + eps_hi)
 
         # Evaluate \delta(eps_0) and \delta'(eps_0)
-        integrand = exp_e * cfx
-        integrand2 = dexp_e * cfx
-        sum_int = np.sum(integrand[kk + 1:])
-        sum_int2 = np.sum(integrand2[kk + 1:])
-        delta_temp = sum_int * dx
-        derivative = sum_int2 * dx
-
-    if (np.real(eps_0) < -L or np.real(eps_0) > L):
+        delta_temp, derivative = _delta_and_derivative(eps_0, neg_x_exp, cfx, dx, nx, L)
+        if not np.isfinite(delta_temp):
+            return float('inf')
+
+    return eps_0
+
+
+# The part of the accountant shared by the remove/add and substitution
+# relations: given the PLD fx from the grid point start onwards, computes the
+# ncomp-fold composition and finds epsilon for which
+# \delta(epsilon) = target_delta. Returns inf if it is out of the window [-L,L].
+# mass_out is the mass of the PLD outside the window, see _mass_outside. The
+# compositions in which it occurs are missing from cfx, and if their mass exceeds
+# target_delta, \delta(epsilon) cannot be resolved in the window and inf is
+# returned. Then too little of the composition remains on the grid for the
+# tail of cfx to show it.
+
+def _accountant_core(fx, dx, nx, L, ncomp, target_delta, tol_newton, start=0, mass_out=0.0):
+    if -np.expm1(ncomp * np.log1p(-mass_out)) > target_delta:
+        return float('inf')
+
+    neg_x_exp = _grid(nx, L)[1]
+    cfx = _compose(fx, ncomp, dx, nx, start)
+    return _newton_epsilon(target_delta, neg_x_exp, cfx, dx, nx, L, tol_newton)
+
+
+# Parameters:
+# target_delta - target delta
+# sigma - noise sigma
+# q - subsampling ratio
+# nx - number of points in the discretisation grid, must be even
+# L -  limit for the integral
+# ncomp - compute up to ncomp number of compositions
+# dtype - precision of the PLD evaluation, np.float64 or np.float32
+
+def get_epsilon_unbounded(target_delta=1e-6, sigma=2.0, q=0.01, ncomp=1E4, nx=1E6, L=20.0, dtype=np.float64):
+    nx = int(nx)
+    _check_grid(nx, ncomp)
+
+    tol_newton = 1e-10  # set this to, e.g., 0.01*target_delta
+
+    dtype = _pld_dtype(dtype, target_delta, L)
+
+    dx = 2.0 * L / nx  # discretisation interval \Delta x
+    x = _grid(nx, L)[0]  # grid for the numerical integration
+    x_pld = x.astype(dtype, copy=False)  # grid for the PLD in the requested precision
+
+    # first ii for which x(ii+1)>log(1-q),
+    # i.e. start of the integral domain
+    ii = int(np.floor(float(nx * (L + np.log(1 - q)) / (2 * L))))
+
+    # Evaluate the PLD distribution, it vanishes on x(0),...,x(ii)
+    # The case of remove/add relation (Subsection 5.1)
+    fx = np.empty(nx - ii - 1, dtype=dtype)
+    _pld_unbounded(x_pld[ii + 1:], sigma, q, fx)
+
+    mass_out = _mass_outside_unbounded(sigma, q, L)
+    eps_0 = _accountant_core(fx, dx, nx, L, ncomp, target_delta, tol_newton, start=ii + 1, mass_out=mass_out)
+
+    if (eps_0 < -L or eps_0 > L):
         print('Error: epsilon out of [-L,L] window, please check the parameters.')
         return float('inf')
     else:
         print(
-            'Unbounded DP-epsilon after ' + str(int(ncomp)) + ' compositions:' + str(np.real(eps_0)) + ' (delta=' + str(
+            'Unbounded DP-epsilon after ' + str(int(ncomp)) + ' compositions:' + str(eps_0) + ' (delta=' + str(
                 target_delta) + ')')
-        return np.real(eps_0)
+        return eps_0
 
 
 # Parameters:
 # target_delta - target delta
 # sigma - noise sigma
 # q - subsampling ratio
-# nx - number of points in the discretisation grid
+# nx - number of points in the discretisation grid, must be even
 # L -  limit for the integral
 # ncomp - compute up to ncomp number of compositions
+# dtype - precision of the PLD evaluation, np.float64 or np.float32
 
-def get_epsilon_bounded(target_delta=1e-6, sigma=2.0, q=0.01, ncomp=1E4, nx=1E6, L=20.0):
+def get_epsilon_bounded(target_delta=1e-6, sigma=2.0, q=0.01, ncomp=1E4, nx=1E6, L=20.0, dtype=np.float64):
     nx = int(nx)
+    _check_grid(nx, ncomp)
 
     tol_newton = 1e-10  # set this to, e.g., 0.01*target_delta
 
-    dx = 2.0 * L / nx  # discretisation interval \Delta x
-    x = np.linspace(-L, L - dx, nx, dtype=np.complex128)  # grid for the numerical integration
+    dtype = _pld_dtype(dtype, target_delta, L)
 
-    # Initial value \epsilon_0
-    eps_0 = 0
+    dx = 2.0 * L / nx  # discretisation interval \Delta x
+    x = _grid(nx, L)[0]  # grid for the numerical integration
+    x_pld = x.astype(dtype, copy=False)  # grid for the PLD in the requested precision
 
-    ii = 1
     # Evaluate the PLD distribution,
     # This is the case of substitution relation (subsection 5.2)
-    c = q * np.exp(-1 / (2 * sigma ** 2))
-    ey = np.exp(x[ii - 1:])
-    term1 = (-(1 - q) * (1 - ey) + np.sqrt((1 - q) ** 2 * (1 - ey) ** 2 + 4 * c ** 2 * ey)) / (2 * c)
-    term1 = np.maximum(term1, 1e-16)
-    Linvx = (sigma ** 2) * np.log(term1)
-
-    sq = np.sqrt((1 - q) ** 2 * (1 - ey) ** 2 + 4 * c ** 2 * ey)
-    nom1 = 4 * c ** 2 * ey - 2 * (1 - q) ** 2 * ey * (1 - ey)
-    term1 = nom1 / (2 * sq)
-    nom2 = term1 + (1 - q) * ey
-    nom2 = nom2 * (sq + (1 - q) * (1 - ey))
-    dLinvx = sigma ** 2 * nom2 / (4 * c ** 2 * ey)
-
-    ALinvx = (1 / np.sqrt(2 * np.pi * sigma ** 2)) * ((1 - q) * np.exp(-Linvx * Linvx / (2 * sigma ** 2)) +
-                                                      q * np.exp(-(Linvx - 1) * (Linvx - 1) / (2 * sigma ** 2)))
-    fx = np.zeros(nx)
-    fx[ii - 1:] = np.real(ALinvx * dLinvx)
-
-    half = int(nx / 2)
-
-    # Flip fx, i.e. fx <- D(fx), the matrix D = [0 I;I 0]
-    temp = np.copy(fx[half:])
-    fx[half:] = np.copy(fx[:half])
-    fx[:half] = temp
-
-    FF1 = np.fft.fft(fx * dx)  # Compute the DFFT
-
-    exp_e = 1 - np.exp(eps_0 - x)
-    # Find first jj for which 1-exp(eps_0-x)>0,
-    # i.e. start of the integral domain
-    jj = int(np.floor(float(nx * (L + np.real(eps_0)) / (2 * L))))
+    fx = np.empty(nx, dtype=dtype)
+    _pld_bounded(x_pld, sigma, q, fx)
 
-    # Compute the inverse DFT
-    cfx = np.fft.ifft((FF1 ** ncomp / dx))
+    mass_out = _mass_outside_bounded(sigma, q, L)
+    eps_0 = _accountant_core(fx, dx, nx, L, ncomp, target_delta, tol_newton, mass_out=mass_out)
 
-    # Flip again, i.e. cfx <- D(cfx), D = [0 I;I 0]
-    temp = np.copy(cfx[half:])
-    cfx[half:] = cfx[:half]
-    cfx[:half] = temp
+    if (eps_0 < -L or eps_0 > L):
+        print('Error: epsilon out of [-L,L] window, please check the parameters.')
+        return float('inf')
+    else:
+        print('Bounded DP-epsilon after ' + str(int(ncomp)) + ' compositions:' + str(eps_0) + ' (delta=' + str(
+            target_delta) + ')')
+        return eps_0
 
-    # Evaluate \delta(eps_0) and \delta'(eps_0)
-    exp_e = 1 - np.exp(eps_0 - x)
-    dexp_e = -np.exp(eps_0 - x)
-    integrand = exp_e * cfx
-    integrand2 = dexp_e * cfx
-    sum_int = np.sum(integrand[jj + 1:])
-    sum_int2 = np.sum(integrand2[jj + 1:])
-    delta_temp = sum_int * dx
-    derivative = sum_int2 * dx
 
-    # Here tol is the stopping criterion for Newton's iteration
-    # e.g., 0.1*delta value or 0.01*delta value (relative error small enough)
-    while np.abs(delta_temp - target_delta) > tol_newton:
+# Parameters:
+# sigma_t - array of sigma values
+# q_t - array of q values
+# ncomp_t - array of numbers of compositions
+# target_delta - target delta
+# nx - number of points in the discretisation grid, must be even
+# L -  limit for the integral
+# bounded - use the substitution relation instead of the remove/add relation
+# dtype - precision of the PLD evaluation, np.float64 or np.float32
+#
+# Computes epsilon separately for each triple (sigma_t[k], q_t[k], ncomp_t[k]),
+# with the same result as get_epsilon_unbounded or get_epsilon_bounded for each
+# of them. This is a convenience for parameter sweeps, it is not faster than the
+# separate calls, and the triples are evaluated one at a time, so the memory use
+# does not grow with their number. Scalars are treated as arrays of one value.
+
+def get_epsilon_batch(sigma_t, q_t, ncomp_t, target_delta=1e-6, nx=1E6, L=20.0, bounded=False, dtype=np.float64):
+    nx = int(nx)
 
-        # print('Residual of the Newton iteration: ' + str(np.abs(delta_temp - target_delta)))
+    sigma_t = np.atleast_1d(np.asarray(sigma_t, dtype=np.float64))
+    q_t = np.atleast_1d(np.asarray(q_t, dtype=np.float64))
+    ncomp_t = np.atleast_1d(np.asarray(ncomp_t, dtype=np.float64))
 
-        # Update epsilon
-        eps_0 = eps_0 - (delta_temp - target_delta) / derivative
+    K = sigma_t.size
 
-        if (eps_0 < -L or eps_0 > L):
-            break
+    if (q_t.size != K or ncomp_t.size != K):
+        print('The arrays for sigma, q and ncomp are of different size!')
+        return np.full(K, float('inf'))
 
-        # Integrands and integral domain
-        exp_e = 1 - np.exp(eps_0 - x)
-        dexp_e = -np.exp(eps_0 - x)
+    _check_grid(nx, ncomp_t)
 
-        # Find first kk for which 1-exp(eps_0-x)>0,
-        # i.e. start of the integral domain
-        kk = int(np.floor(float(nx * (L + np.real(eps_0)) / (2 * L))))
+    if K == 0:
+        return np.empty(0)
 
-        integrand = exp_e * cfx
-        sum_int = np.sum(integrand[kk + 1:])
-        delta_temp = sum_int * dx
+    tol_newton = 1e-10  # set this to, e.g., 0.01*target_delta
 
-        # Evaluate \delta(eps_0) and \delta'(eps_0)
-        integrand = exp_e * cfx
-        integrand2 = dexp_e * cfx
-        sum_int = np.sum(integrand[kk + 1:])
-        sum_int2 = np.sum(integrand2[kk + 1:])
-        delta_temp = sum_int * dx
-        derivative = sum_int2 * dx
-
-    if (np.real(eps_0) < -L or np.real(eps_0) > L):
-        print('Error: epsilon out of [-L,L] window, please check the parameters.')
-        return float('inf')
-    else:
-        print('Bounded DP-epsilon after ' + str(int(ncomp)) + ' compositions:' + str(np.real(eps_0)) + ' (delta=' + str(
-            target_delta) + ')')
-        return np.real(eps_0)
-        #
-        # print('Bounded DP-epsilon after ' + str(int(ncomp)) + ' compositions:' + str(np.real(eps_0)) + ' (delta=' + str(target_delta) + ')')
-        # return np.real(eps_0)
+    dtype = _pld_dtype(dtype, target_delta, L)
+
+    dx = 2.0 * L / nx  # discretisation interval \Delta x
+    x = _grid(nx, L)[0]  # grid for the numerical integration
+    x_pld = x.astype(dtype, copy=False)  # grid for the PLD in the requested precision
+
+    # The parameter triples are evaluated one at a time, so that only the
+    # buffers of a single PLD and its composition are held in memory. The PLDs
+    # are written into the same buffer.
+    fx_buf = np.empty(nx, dtype=dtype)
+
+    eps = np.empty(K)
+    for k in range(K):
+        if bounded:
+            # This is the case of substitution relation (subsection 5.2)
+            start = 0
+            _pld_bounded(x_pld, sigma_t[k], q_t[k], fx_buf)
+            mass_out = _mass_outside_bounded(sigma_t[k], q_t[k], L)
+        else:
+            # first ii for which x(ii+1)>log(1-q),
+            # i.e. start of the integral domain
+            # The case of remove/add relation (Subsection 5.1)
+            ii = int(np.floor(float(nx * (L + np.log(1 - q_t[k])) / (2 * L))))
+            start = ii + 1
+            _pld_unbounded(x_pld[start:], sigma_t[k], q_t[k], fx_buf[start:])
+            mass_out = _mass_outside_unbounded(sigma_t[k], q_t[k], L)
+
+        eps_0 = _accountant_core(fx_buf[start:], dx, nx, L, ncomp_t[k], target_delta, tol_newton, start=start,
+                                 mass_out=mass_out)
+
+        if (eps_0 < -L or eps_0 > L):
+            print('Error: epsilon out of [-L,L] window for sigma=' + str(sigma_t[k]) + ', q=' + str(
+                q_t[k]) + ', ncomp=' + str(int(ncomp_t[k])) + ', please check the parameters.')
+            eps[k] = float('inf')
+        else:
+            eps[k] = eps_0
+
+    return eps
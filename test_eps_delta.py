@@ -20,6 +20,14 @@ if __name__ == "__main__":
     c = compute_delta.get_delta_unbounded(q=q, sigma=sigma, target_eps=eps, L=L, nx=nx, ncomp=nc)
     d = compute_delta.get_delta_bounded(q=q, sigma=sigma, target_eps=eps, L=L, nx=nx, ncomp=nc)
 
+    # Example of a sweep over the number of compositions
+
+    nc_values = np.array([1000, 5000, 10000])
+
+    e = compute_eps.get_epsilon_batch(sigma_t=np.full(nc_values.size, sigma), q_t=np.full(nc_values.size, q),
+                                      ncomp_t=nc_values, target_delta=delta, L=L, nx=nx)
+    print('Unbounded DP-epsilon for ' + str(nc_values) + ' compositions: ' + str(e) + ' (delta=' + str(delta) + ')')
+
     # Examples for varying sigma and q
 
     L = 100
@@ -37,3 +45,24 @@ if __name__ == "__main__":
 
     c = compute_delta_var.get_delta_bounded(q_t=q_values, sigma_t=sigmas, target_eps=eps, L=L, nx=nx)
     d = compute_delta_var.get_delta_unbounded(q_t=q_values, sigma_t=sigmas, target_eps=eps, L=L, nx=nx)
+
+    # Regression check for large numbers of compositions, where the FFT noise
+    # floor of the composed PLD is above 1e-11 times its maximum. The values are
+    # those of the original implementation, and widening the window must not
+    # change the result.
+
+    delta = 1e-5
+
+    a = compute_eps.get_epsilon_bounded(q=0.001, sigma=1.0, target_delta=delta, L=20, nx=2E6, ncomp=1E5)
+    b = compute_eps.get_epsilon_unbounded(q=0.001, sigma=1.0, target_delta=delta, L=20, nx=2E6, ncomp=1E5)
+    assert np.isclose(a, 2.8377, atol=1e-4) and np.isclose(b, 1.8852, atol=1e-4)
+
+    c = compute_eps.get_epsilon_bounded(q=256 / 60000, sigma=1.1, target_delta=delta, L=20, nx=4E6, ncomp=60000)
+    d = compute_eps.get_epsilon_bounded(q=256 / 60000, sigma=1.1, target_delta=delta, L=40, nx=4E6, ncomp=60000)
+    assert np.isclose(c, 10.0019, atol=1e-4) and np.isclose(d, c, atol=1e-4)
+
+    # Most of the composition leaves a narrow window, so that neither end of it
+    # shows the mass past L. The true epsilon is about 36.7.
+
+    e = compute_eps.get_epsilon_bounded(q=0.9, sigma=0.8, target_delta=1e-3, L=3, nx=2E5, ncomp=10)
+    assert e == float('inf')